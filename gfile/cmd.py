@@ -17,11 +17,14 @@ def main():
     parser.add_argument('uri', help='filename to upload or url to download')
     parser.add_argument('-p', '--hide-progress', dest='progress', action='store_false', default=True, help='hide progress bar')
     parser.add_argument('-o', '--output', type=str, default=None, help='output filename for download (default: use original name)')
-    parser.add_argument('--aria2', nargs='?', const="-x10 -s10", default=None, help='download with aria2. You can also specify optional arguments (default: "-x10 -s10", make sure to quote). `-o` is already automatically included.')
-    parser.add_argument('-n', '--thread-num', dest='thread_num', default=8, type=int, help='number of threads used for upload [default: 8]')
-    parser.add_argument('-s', '--chunk-size', dest='chunk_size', default="100MB", help='chunk size per upload in bytes; note: chunk_size*thread will be loaded into memory [default: 100MB]')
-    parser.add_argument('-m', '--copy-size', dest='chunk_copy_size', default="1MB", help='specifies size to copy the main file into pieces [default: 1MB]')
+    parser.add_argument('--aria2', nargs='?', const=True, default=None, help='download with aria2. You can also specify optional arguments (default: "-x16 -s16 -k1M", make sure to quote). `-o` is already automatically included.')
+    parser.add_argument('-n', '--thread-num', dest='thread_num', default=8, type=int, help='number of threads used for upload and download [default: 8]')
+    parser.add_argument('--auto-threads', dest='auto_threads', action='store_true', help='raise the number of upload threads based on the measured RTT and bandwidth')
+    parser.add_argument('-s', '--chunk-size', dest='chunk_size', default="100MB", help='chunk size per upload in bytes [default: 100MB]')
+    parser.add_argument('-m', '--copy-size', dest='chunk_copy_size', default="4MB", help='specifies size to copy the main file into pieces [default: 4MB]')
     parser.add_argument('-t', '--timeout', type=int, default=10, help='specifies timeout time (in seconds) [default: 10]')
+    parser.add_argument('--io-uring', dest='use_io_uring', action='store_true', help='read the file to upload through io_uring (Linux only, requires the liburing package)')
+    parser.add_argument('--fallocate', action='store_true', help='reserve disk space for downloads up front (slow on filesystems without native fallocate support)')
     parser.add_argument('-pw', '--password', type=str, default=None, help='password for downloading a protected file')
 
     args = parser.parse_args()
@@ -1,8 +1,14 @@
 import concurrent.futures
+import errno
 import functools
 import io
 import math
+import os
+import queue
 import re
+import stat
+import tempfile
+import threading
 import time
 import uuid
 from datetime import datetime
@@ -11,30 +17,59 @@ from pathlib import Path
 from subprocess import run
 
 import requests
-from bs4 import BeautifulSoup
 from requests.adapters import HTTPAdapter
-from requests_toolbelt import MultipartEncoder, StreamingIterator
+from selectolax.lexbor import LexborHTMLParser
 from tqdm import tqdm
+from urllib3.poolmanager import PoolKey
 from urllib3.util.retry import Retry
 
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+
+_SIZE_RE = re.compile(r'^(?P<num>\d+) ?((?P<unit>[KMGTPEZY]?)(iB|B)?)$', re.IGNORECASE)
+_SERVER_RE = re.compile(r'var server = "(.+?)"')
+_DL_URL_RE = re.compile(r'^https?:\/\/\d+?\.gigafile\.nu\/([a-z0-9-]+)$')
+_FILE_ID_RE = re.compile(r'download\(\d+, *\'(.+?)\'')
+_SIZE_PAREN_RE = re.compile(r'（(.+?)）')
+_SANITIZE_RE = re.compile(r'[\\/:*?"<>|]')
+
+_UNITS = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
+_UNIT_SHIFT = {unit[0]: i * 10 for i, unit in enumerate(_UNITS)}
+
 
 def bytes_to_size_str(bytes):
    if bytes == 0:
        return "0B"
-   units = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
-   i = int(math.floor(math.log(bytes, 1024)))
-   p = math.pow(1024, i)
-   return f"{bytes/p:.02f} {units[i]}"
+   i = min((int(bytes).bit_length() - 1) // 10, len(_UNITS) - 1)
+   p = 1 << (i * 10)
+   return f"{bytes/p:.02f} {_UNITS[i]}"
 
 
 def size_str_to_bytes(size_str):
     if isinstance(size_str, int):
         return size_str
-    m = re.search(r'^(?P<num>\d+) ?((?P<unit>[KMGTPEZY]?)(iB|B)?)$', size_str, re.IGNORECASE)
+    m = _SIZE_RE.search(size_str)
     assert m
-    units = ("B", "K", "M", "G", "T", "P", "E", "Z", "Y")
     unit = (m['unit'] or 'B').upper()
-    return int(math.pow(1024, units.index(unit)) * int(m['num']))
+    return int(m['num']) << _UNIT_SHIFT[unit]
+
+
+class BlockSizeAdapter(HTTPAdapter):
+    """HTTPAdapter that sends request bodies in ``blocksize`` pieces, so fewer Python-level reads hold the GIL."""
+    __attrs__ = HTTPAdapter.__attrs__ + ['blocksize']
+
+    def __init__(self, *args, blocksize=None, **kwargs):
+        self.blocksize = blocksize # needed by init_poolmanager, which the parent __init__ calls
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **pool_kwargs):
+        # urllib3 < 2 doesn't know blocksize as a pool key
+        if self.blocksize and 'key_blocksize' in PoolKey._fields:
+            pool_kwargs['blocksize'] = self.blocksize
+        super().init_poolmanager(*args, **pool_kwargs)
 
 
 def requests_retry_session(
@@ -42,6 +77,9 @@ def requests_retry_session(
     backoff_factor=0.2,
     status_forcelist=None, # (500, 502, 504)
     session=None,
+    blocksize=None,
+    pool_connections=10,
+    pool_maxsize=10,
 ):
     session = session or requests.Session()
     retry = Retry(
@@ -49,38 +87,232 @@ def requests_retry_session(
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = BlockSizeAdapter(max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize, blocksize=blocksize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
 
-def split_file(input_file, out, target_size=None, start=0, chunk_copy_size=1024*1024):
+class TruncatedFileError(Exception):
+    """The file got shorter than expected while being read."""
+
+
+def read_blocks_io_uring(fd, start, size, buffers):
+    """Read ``size`` bytes of ``fd`` from ``start`` through io_uring into the given equally sized bytearrays.
+
+    Returns a generator of memoryviews in file order while one read per buffer is kept in flight.
+    Each view is only valid until the next one is requested. Raises OSError if io_uring is unavailable.
+    """
+    if liburing is None:
+        raise OSError('liburing is not installed')
+    ring = liburing.Ring()
+    liburing.io_uring_queue_init(len(buffers), ring)
+    blocks = _io_uring_blocks(ring, fd, start, size, buffers)
+    next(blocks) # submit the first reads now; a started generator always tears the ring down on close()
+    return blocks
+
+
+def _io_uring_blocks(ring, fd, start, size, buffers):
+    block_size = len(buffers[0])
+    blocks = math.ceil(size / block_size)
+    bufs = buffers[:blocks]
+    cqe = liburing.Cqe()
+    results = {}
+    submitted = completed = 0
+
+    def submit():
+        nonlocal submitted
+        sqe = liburing.io_uring_get_sqe(ring)
+        liburing.io_uring_prep_read(sqe, fd, bufs[submitted % len(bufs)], start + submitted * block_size)
+        liburing.io_uring_sqe_set_data64(sqe, submitted)
+        submitted += 1
+
+    def reap():
+        nonlocal completed
+        liburing.io_uring_wait_cqe(ring, cqe)
+        c = cqe[0]
+        results[liburing.io_uring_cqe_get_data64(c)] = c.res
+        liburing.io_uring_cqe_seen(ring, c)
+        completed += 1
+
+    try:
+        while submitted < len(bufs):
+            submit()
+        liburing.io_uring_submit(ring)
+        yield
+        for i in range(blocks):
+            while i not in results:
+                reap()
+            res = results.pop(i)
+            if res < 0:
+                raise OSError(-res, os.strerror(-res))
+            expected = min(block_size, size - i * block_size)
+            if res < expected:
+                raise TruncatedFileError(f'File is truncated, {expected - res} bytes missing!')
+            yield memoryview(bufs[i % len(bufs)])[:expected]
+            # the consumer is done with this buffer, reuse it for the next block
+            if submitted < blocks:
+                submit()
+                liburing.io_uring_submit(ring)
+    finally:
+        # the kernel may still write into our buffers, wait for everything in flight first
+        while completed < submitted:
+            reap()
+        liburing.io_uring_queue_exit(ring)
+
+
+def split_file(input_file, out, target_size=None, start=0, chunk_copy_size=1024*1024*4, input_size=None, use_io_uring=False):
     input_file = Path(input_file)
     size = 0
 
-    input_size = input_file.stat().st_size
+    if input_size is None:
+        input_size = input_file.stat().st_size
     if target_size is None:
         output_size = input_size - start
     else:
         output_size = min( target_size, input_size - start)
 
     with open(input_file, 'rb') as f:
-        f.seek(start)
+        if output_size > 0 and hasattr(os, 'sendfile'):
+            try:
+                out_fd = out.fileno()
+            except (AttributeError, OSError):
+                out_fd = None
+            if out_fd is not None and stat.S_ISREG(os.fstat(out_fd).st_mode):
+                # let the kernel copy file to file without going through Python
+                out.flush()
+                try:
+                    while size < output_size:
+                        n = os.sendfile(out_fd, f.fileno(), start + size, min(chunk_copy_size, output_size - size))
+                        if not n: break
+                        size += n
+                except OSError:
+                    # e.g. platforms where the target has to be a socket
+                    if size: raise
+                out.seek(0, os.SEEK_CUR) # resync with the fd position moved by sendfile
+
+        if use_io_uring and size < output_size:
+            try:
+                bufs = [bytearray(min(chunk_copy_size, output_size - size)) for _ in range(4)]
+                blocks = read_blocks_io_uring(f.fileno(), start + size, output_size - size, bufs)
+            except OSError:
+                blocks = () # not Linux or too old a kernel, use plain reads below
+            for block in blocks:
+                out.write(block)
+                size += len(block)
+
+        buf = memoryview(bytearray(max(0, min(chunk_copy_size, output_size - size))))
+        f.seek(start + size)
         while True:
             # print(f'{size / output_size * 100:.2f}%', end='\r')
             if size == output_size: break
             if size > output_size:
                 raise Exception(f'Size ({size}) is larger than {target_size} bytes!')
             current_chunk_size = min(chunk_copy_size, output_size - size)
-            chunk = f.read(current_chunk_size)
-            if not chunk: break
-            size += len(chunk)
-            out.write(chunk)
+            n = f.readinto(buf[:current_chunk_size])
+            if not n: break
+            size += n
+            out.write(buf[:n])
+
+
+def preallocate(f, size, fallocate=False):
+    """Size the open file ``f`` to ``size`` bytes up front so it doesn't have to grow while being written.
+
+    By default this only truncates, which makes a cheap sparse file. With ``fallocate`` the blocks are
+    reserved too, so a full disk fails right away; but glibc emulates it by writing every block on
+    filesystems without native support (NFSv3, FUSE, ...), which can take a long time for big files.
+    """
+    if fallocate and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as ex:
+            # only fall back for filesystems that don't support it, e.g. a full disk should fail right here
+            if ex.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+    f.truncate(size)
+
+
+class PartIO:
+    """Read-only file-like view of ``size`` bytes of a file starting at ``start``.
+
+    Used as the file part of the upload body so a chunk is streamed from disk
+    instead of being loaded into memory first.
+    """
+    def __init__(self, input_file, start, size, callback=None, on_eof=None, buffer=None, input_size=None, use_io_uring=False, io_uring_buffers=None):
+        self.f = open(input_file, 'rb')
+        self.f.seek(start)
+        if input_size is None:
+            input_size = os.fstat(self.f.fileno()).st_size
+        self.remaining = max(0, min(size, input_size - start))
+        if hasattr(os, 'posix_fadvise') and self.remaining:
+            # let the kernel read ahead of us while the previous block is being sent
+            os.posix_fadvise(self.f.fileno(), start, self.remaining, os.POSIX_FADV_SEQUENTIAL)
+        self.callback = callback
+        self.on_eof = on_eof
+        # optional reusable read buffer; what we return must be consumed before the next read
+        self.buffer = memoryview(buffer) if buffer is not None else None
+        self.blocks = None
+        self.pending = b''
+        if use_io_uring and self.remaining:
+            try:
+                # keep the next block in flight while the current one is being sent
+                if io_uring_buffers is None:
+                    io_uring_buffers = [bytearray(min(1024*1024*4, self.remaining)) for _ in range(2)]
+                self.blocks = read_blocks_io_uring(self.f.fileno(), start, self.remaining, io_uring_buffers)
+            except OSError:
+                pass
+
+    @property
+    def len(self):
+        return self.remaining
+
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self.remaining:
+            n = self.remaining
+        if self.blocks is not None:
+            if not self.pending:
+                self.pending = next(self.blocks, b'')
+            data, self.pending = self.pending[:n], self.pending[n:]
+        elif self.buffer is None:
+            data = self.f.read(n)
+        else:
+            data = self.buffer[:min(n, len(self.buffer))]
+            data = data[:self.f.readinto(data)]
+        self.remaining -= len(data)
+        if n and not data:
+            raise TruncatedFileError(f'File is truncated, {self.remaining} bytes missing!')
+        if self.callback and data:
+            self.callback(len(data))
+        if self.on_eof and data and self.remaining == 0:
+            self.on_eof()
+        return data
+
+    def close(self):
+        if self.blocks is not None:
+            self.blocks.close()
+        self.f.close()
+
+
+class ChainedReader:
+    """Read-only file-like object that reads through ``parts`` (bytes or file-like objects with ``len``) in order."""
+    def __init__(self, parts):
+        self.parts = [io.BytesIO(p) if isinstance(p, bytes) else p for p in parts]
+        self.len = sum(len(p) if isinstance(p, bytes) else p.len for p in parts)
+
+    def read(self, n=-1):
+        # returns data from one part at a time, which may be shorter than n
+        while self.parts:
+            data = self.parts[0].read(n)
+            if data:
+                self.len -= len(data)
+                return data
+            self.parts.pop(0)
+        return b''
 
 
 class GFile:
-    def __init__(self, uri, progress=False, thread_num=4, chunk_size=1024*1024*10, chunk_copy_size=1024*1024, timeout=10, password=None, aria2=False, **kwargs) -> None:
+    def __init__(self, uri, progress=False, thread_num=4, chunk_size=1024*1024*10, chunk_copy_size=1024*1024*4, timeout=10, password=None, aria2=False, use_io_uring=False, auto_threads=False, fallocate=False, **kwargs) -> None:
         self.uri = uri
         self.chunk_size = size_str_to_bytes(chunk_size)
         self.chunk_copy_size = size_str_to_bytes(chunk_copy_size)
@@ -89,85 +321,160 @@ class GFile:
         self.data = None
         self.pbar = None
         self.timeout = timeout
-        self.session = requests_retry_session()
-        self.session.request = functools.partial(self.session.request, timeout=self.timeout)
         self.cookies = None
-        self.current_chunk = 0
+        self._cv = threading.Condition()
+        self._current_chunk = 0
+        self._buf_pool = queue.LifoQueue()
         self.password = password
         self.aria2 = aria2
+        self.use_io_uring = use_io_uring
+        self.auto_threads = auto_threads
+        self.fallocate = fallocate
+
+
+    @functools.cached_property
+    def session(self):
+        # one connection per upload thread, so workers never queue on the pool
+        pool_size = max(self.thread_num, 10)
+        session = requests_retry_session(blocksize=self.chunk_copy_size, pool_connections=pool_size, pool_maxsize=pool_size)
+        session.request = functools.partial(session.request, timeout=self.timeout)
+        return session
 
 
     def upload_chunk(self, chunk_no, chunks):
-        bar = self.pbar[chunk_no % self.thread_num] if self.pbar else None
-        with io.BytesIO() as f:
-            split_file(self.uri, f, self.chunk_size, start=chunk_no * self.chunk_size, chunk_copy_size=self.chunk_copy_size)
-            chunk_size = f.tell()
-            f.seek(0)
-            fields = {
-                "id": self.token,
-                "name": Path(self.uri).name,
-                "chunk": str(chunk_no),
-                "chunks": str(chunks),
-                "lifetime": "100",
-                "file": ("blob", f, "application/octet-stream"),
-            }
-            form_data = MultipartEncoder(fields)
-            headers = {
-                "content-type": form_data.content_type,
-            }
-            # convert the form-data into a binary string, this way we can control/throttle its read() behavior
-            form_data_binary = form_data.to_string()
-            del form_data
-
-        size = len(form_data_binary)
-        if bar:
-            bar.desc = f'chunk {chunk_no + 1}/{chunks}'
-            bar.reset(total=size)
-            # bar.refresh()
-
-        def gen():
-            offset = 0
+        bar = self.pbar[chunk_no % len(self.pbar)] if self.pbar else None
+
+        def on_read(n):
+            if bar:
+                bar.update(n)
+                bar.refresh()
+
+        def wait_for_turn():
+            # hold back the tail of the body until all previous chunks are finished
+            with self._cv:
+                self._cv.wait_for(lambda: chunk_no == self._current_chunk or self.failed)
+                if self.failed:
+                    raise Exception(f'Chunk {chunk_no} aborted.')
+
+        # reuse read buffers across chunks, at most thread_num sets of them are ever alive.
+        # io_uring keeps a second read in flight, so it gets a pair per worker
+        try:
+            bufs = self._buf_pool.get_nowait()
+        except queue.Empty:
+            bufs = [bytearray(self.chunk_copy_size) for _ in range(2 if self.use_io_uring else 1)]
+        try:
             while True:
-                if offset < size:
-                    update_tick = 1024 * 128
-                    yield form_data_binary[offset:offset+update_tick]
+                part = PartIO(self._path, chunk_no * self.chunk_size, self.chunk_size, callback=on_read, on_eof=wait_for_turn, buffer=bufs[0], input_size=self._size, use_io_uring=self.use_io_uring, io_uring_buffers=bufs)
+                try:
+                    # only the chunk number differs between chunks, the rest of the form is prebuilt in upload()
+                    prefix = self._form_head + str(chunk_no).encode() + self._form_tail
+                    body = ChainedReader([prefix, part, self._form_end])
+                    headers = {
+                        "content-type": f"multipart/form-data; boundary={self._boundary}",
+                        "content-length": str(body.len),
+                    }
                     if bar:
-                        bar.update(min(update_tick, size - offset))
-                        bar.refresh()
-                    offset += update_tick
+                        bar.desc = f'chunk {chunk_no + 1}/{chunks}'
+                        bar.reset(total=body.len)
+                        # only the file part reports progress, count the form fields upfront
+                        bar.update(body.len - part.len)
+                    resp = self.session.post(f"https://{self.server}/upload_chunk.php", data=body, headers=headers)
+                except TruncatedFileError as ex:
+                    # retrying can't help if the file changed under us
+                    print(ex)
+                    self._abort()
+                    return
+                except Exception as ex:
+                    if self.failed:
+                        return
+                    print(ex)
+                    print('Retrying...')
                 else:
-                    if chunk_no != self.current_chunk:
-                        time.sleep(0.01)
-                    else:
-                        time.sleep(0.1)
-                        break
-        while True:
-            try:
-                streamer = StreamingIterator(size, gen())
-                resp = self.session.post(f"https://{self.server}/upload_chunk.php", data=streamer, headers=headers)
-            except Exception as ex:
-                print(ex)
-                print('Retrying...')
-            else:
-                break
+                    break
+                finally:
+                    part.close()
+        finally:
+            self._buf_pool.put(bufs)
 
-        resp_data = resp.json()
-        self.current_chunk += 1
+        try:
+            resp_data = resp.json()
+        except ValueError:
+            print(f'Invalid response for chunk {chunk_no}: {resp.text[:200]}')
+            self._abort()
+            return
+        with self._cv:
+            self._current_chunk += 1
+            self._cv.notify_all()
 
         if 'url' in resp_data:
             self.data = resp_data
         if 'status' not in resp_data or resp_data['status']:
             print(resp_data)
+            self._abort()
+
+
+    def _abort(self):
+        # wake up every worker waiting for its turn so it can give up
+        with self._cv:
             self.failed = True
+            self._cv.notify_all()
+
+
+    def auto_scale_threads(self, bandwidth):
+        """Return the number of upload threads needed so the chunks in flight cover the bandwidth-delay product of the link.
+
+        The RTT is the fastest of 3 HEAD requests to the upload server (the first one may still pay for
+        the TLS handshake), ``bandwidth`` is what the first chunk achieved in bytes per second.
+        Keeping the link busy then takes ``bandwidth * rtt / chunk_size`` chunks in flight, clamped
+        between the configured thread_num and 32. thread_num itself is left alone, so downloads are not affected.
+        """
+        rtts = []
+        for _ in range(3):
+            started = time.perf_counter()
+            try:
+                self.session.head(f'https://{self.server}/')
+            except Exception:
+                continue
+            rtts.append(time.perf_counter() - started)
+        if not rtts:
+            return self.thread_num
+        rtt = min(rtts)
+        thread_num = max(self.thread_num, min(32, int(bandwidth * rtt / self.chunk_size)))
+        if thread_num == self.thread_num:
+            return thread_num
+        print(f'RTT {rtt * 1000:.0f} ms, {bytes_to_size_str(int(bandwidth))}/s per connection, using {thread_num} threads.')
+        # grow the connection pool and the progress bars along with the threads.
+        # the adapters being replaced are closed right away instead of leaving their sockets to the GC
+        if thread_num > max(self.thread_num, 10):
+            for adapter in set(self.session.adapters.values()):
+                adapter.close()
+            requests_retry_session(session=self.session, blocksize=self.chunk_copy_size, pool_connections=thread_num, pool_maxsize=thread_num)
+        if self.pbar:
+            for i in range(len(self.pbar), thread_num):
+                self.pbar.append(tqdm(total=self._size, unit="B", unit_scale=True, leave=False, unit_divisor=1024, ncols=100, position=i))
+        return thread_num
 
 
     def upload(self):
         self.token = uuid.uuid1().hex
         self.pbar = None
         self.failed = False
-        assert Path(self.uri).exists()
-        size = Path(self.uri).stat().st_size
+        self._current_chunk = 0
+        # stat once here, workers only need the cached values
+        self._path = Path(self.uri)
+        assert self._path.exists()
+        size = self._size = self._path.stat().st_size
+        self._name = self._path.name
         chunks = math.ceil(size / self.chunk_size)
+
+        self._boundary = uuid.uuid4().hex
+        def field(name, value):
+            return f'--{self._boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        self._form_head = field('id', self.token) + field('name', self._name) + f'--{self._boundary}\r\nContent-Disposition: form-data; name="chunk"\r\n\r\n'.encode()
+        self._form_tail = (b'\r\n' + field('chunks', chunks) + field('lifetime', '100')
+            + f'--{self._boundary}\r\nContent-Disposition: form-data; name="file"; filename="blob"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+        self._form_end = f'\r\n--{self._boundary}--\r\n'.encode()
+
         print(f'Filesize {bytes_to_size_str(size)}, chunk size: {bytes_to_size_str(self.chunk_size)}, total chunks: {chunks}')
 
         if self.progress:
@@ -175,16 +482,34 @@ class GFile:
             for i in range(self.thread_num):
                 self.pbar.append(tqdm(total=size, unit="B", unit_scale=True, leave=False, unit_divisor=1024, ncols=100, position=i))
 
-        self.server = re.search(r'var server = "(.+?)"', self.session.get('https://gigafile.nu/').text)[1]
+        # only read the home page until the server variable shows up
+        with self.session.get('https://gigafile.nu/', stream=True) as r:
+            buf = b''
+            for chunk in r.iter_content(8192):
+                buf += chunk
+                m = _SERVER_RE.search(buf.decode('utf-8', 'ignore'))
+                if m:
+                    self.server = m[1]
+                    break
+            else:
+                raise Exception('Failed to get the upload server from gigafile.nu!')
 
         # upload the first chunk to set cookies properly.
+        started = time.perf_counter()
         self.upload_chunk(0, chunks)
+        thread_num = self.thread_num
+        if self.auto_threads and chunks > 1 and not self.failed:
+            thread_num = self.auto_scale_threads(min(size, self.chunk_size) / (time.perf_counter() - started))
 
         # upload second to second last chunk(s)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_num) as ex:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=thread_num) as ex:
             futures = {ex.submit(self.upload_chunk, i, chunks): i for i in range(1, chunks)}
             try:
                 for future in concurrent.futures.as_completed(futures):
+                    if not future.cancelled() and future.exception():
+                        # an error escaped upload_chunk, later chunks would wait for this one forever
+                        print(f'Chunk {futures[future]}: {future.exception()}')
+                        self._abort()
                     if self.failed:
                         print('Failed!')
                         for future in futures:
@@ -192,6 +517,7 @@ class GFile:
                         return
             except KeyboardInterrupt:
                 print('\nUser cancelled the operation.')
+                self._abort()
                 for future in futures:
                     future.cancel()
                 return
@@ -219,24 +545,93 @@ class GFile:
         return self.data['url']
 
 
+    def _probe_ranges(self, url):
+        """Return the file size if the server serves byte ranges of it, else None."""
+        try:
+            r = self.session.head(url, allow_redirects=True)
+            r.raise_for_status()
+        except Exception:
+            return None
+        if r.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            return None
+        if r.headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        filesize = int(r.headers.get('Content-Length', 0))
+        return filesize if filesize > 0 else None
+
+
+    def _download_range(self, url, temp, lo, hi, lock, stop):
+        with self.session.get(url, stream=True, headers={'Range': f'bytes={lo}-{hi-1}'}) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise Exception(f'Server ignored the range request (HTTP {r.status_code}).')
+            mv = memoryview(bytearray(min(self.chunk_copy_size, hi - lo)))
+            size = 0
+            # each worker has its own handle on the preallocated file and writes a disjoint range
+            with open(temp, 'r+b') as f:
+                f.seek(lo)
+                while size < hi - lo and not stop.is_set():
+                    n = r.raw.readinto(mv[:hi - lo - size])
+                    if not n: break
+                    f.write(mv[:n])
+                    size += n
+                    if self.pbar:
+                        with lock:
+                            self.pbar.update(n)
+        if size != hi - lo:
+            raise Exception(f'Range {lo}-{hi-1} is incomplete ({size} of {hi - lo} bytes).')
+        return size
+
+
+    def _download_parallel(self, url, temp, filesize):
+        """Download ``url`` into ``temp`` with one range request per thread.
+
+        Returns the number of bytes downloaded, or None if the server turned out not to support ranges.
+        """
+        with open(temp, 'wb') as f:
+            preallocate(f, filesize, self.fallocate)
+        part = math.ceil(filesize / self.thread_num)
+        lock = threading.Lock()
+        stop = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_num) as ex:
+            futures = [ex.submit(self._download_range, url, temp, lo, min(lo + part, filesize), lock, stop) for lo in range(0, filesize, part)]
+            size = 0
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    size += future.result()
+            except KeyboardInterrupt:
+                print('\nUser cancelled the operation.')
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+            except Exception as err:
+                print(err)
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                return None
+        return size
+
+
     def download(self, filename=None):
-        m = re.search(r'^https?:\/\/\d+?\.gigafile\.nu\/([a-z0-9-]+)$', self.uri)
+        m = _DL_URL_RE.search(self.uri)
         if not m:
             print('Invalid URL.')
             return
         r = self.session.get(self.uri) # setup cookie
         try:
-            soup = BeautifulSoup(r.text, 'html.parser')
-            if soup.select_one('#contents_matomete'):
+            tree = LexborHTMLParser(r.text)
+            if tree.css_first('#contents_matomete'):
                 print('Matomete mode. Getting info of first file (currently only support one file)...')
-                ele = soup.select_one('.matomete_file')
-                web_name = ele.select_one('.matomete_file_info > span:nth-child(2)').text.strip()
-                file_id = re.search(r'download\(\d+, *\'(.+?)\'', ele.select_one('.download_panel_btn_dl')['onclick'])[1]
-                size_str = re.search(r'（(.+?)）', ele.select_one('.matomete_file_info > span:nth-child(3)').text.strip())[1]
+                ele = tree.css_first('.matomete_file')
+                web_name = ele.css_first('.matomete_file_info > span:nth-child(2)').text().strip()
+                file_id = _FILE_ID_RE.search(ele.css_first('.download_panel_btn_dl').attributes['onclick'])[1]
+                size_str = _SIZE_PAREN_RE.search(ele.css_first('.matomete_file_info > span:nth-child(3)').text().strip())[1]
             else:
                 file_id = m[1]
-                size_str = soup.select_one('.dl_size').text.strip()
-                web_name = soup.select_one('#dl').text.strip()
+                size_str = tree.css_first('.dl_size').text().strip()
+                web_name = tree.css_first('#dl').text().strip()
 
             print(f'Name: {web_name}, size: {size_str}, id: {file_id}')
         except Exception as ex:
@@ -246,34 +641,64 @@ class GFile:
 
         if not filename:
             # only sanitize web filename. User provided ones are on their own.
-            filename = re.sub(r'[\\/:*?"<>|]', '_', web_name)
+            filename = _SANITIZE_RE.sub('_', web_name)
 
         download_url = self.uri.rsplit('/', 1)[0] + '/download.php?file=' + file_id
         if self.password:
             download_url = download_url + '&dlkey=' + self.password
 
         if self.aria2:
-            cookie_str = "; ".join([f"{cookie.name}={cookie.value}" for cookie in self.session.cookies])
-            cmd = ['aria2c', download_url, '--header', f'Cookie: {cookie_str}', '-o', filename]
-            cmd.extend(self.aria2.split(' '))
-            run(cmd)
+            # hand the cookies over in Netscape format so aria2 applies its own quoting and domain rules
+            fd, cookie_file = tempfile.mkstemp(prefix='gfile_cookies_', suffix='.txt')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    for c in self.session.cookies:
+                        # expiry 0 marks a session cookie
+                        f.write('\t'.join([c.domain, 'TRUE' if c.domain.startswith('.') else 'FALSE', c.path, 'TRUE' if c.secure else 'FALSE', str(int(c.expires or 0)), c.name, c.value or '']) + '\n')
+                cmd = ['aria2c', download_url, '--load-cookies', cookie_file, '-o', filename]
+                cmd.extend(['-x16', '-s16', '-k1M'] if self.aria2 is True else self.aria2.split(' '))
+                run(cmd)
+            finally:
+                os.remove(cookie_file)
             return
 
         temp = filename + '.dl'
+        desc = filename if len(filename) <= 20 else filename[0:11] + '..' + filename[-7:]
 
-        with self.session.get(download_url, stream=True) as r:
-            r.raise_for_status()
-            filesize = int(r.headers['Content-Length'])
+        filesize = self._probe_ranges(download_url) if self.thread_num > 1 else None
+        if filesize:
             if self.progress:
-                desc = filename if len(filename) <= 20 else filename[0:11] + '..' + filename[-7:]
                 self.pbar = tqdm(total=filesize, unit='B', unit_scale=True, unit_divisor=1024, desc=desc)
-            with open(temp, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=self.chunk_copy_size):
-                    f.write(chunk)
-                    if self.pbar: self.pbar.update(len(chunk))
+            filesize_downloaded = self._download_parallel(download_url, temp, filesize)
+            if filesize_downloaded is None:
+                print('Falling back to single connection download.')
+                if self.pbar: self.pbar.close()
+                self.pbar = None
+                filesize = None
+
+        if not filesize:
+            with self.session.get(download_url, stream=True) as r:
+                r.raise_for_status()
+                filesize = int(r.headers['Content-Length'])
+                if self.progress:
+                    self.pbar = tqdm(total=filesize, unit='B', unit_scale=True, unit_divisor=1024, desc=desc)
+                # read straight into one reusable buffer instead of a new bytes object per piece
+                mv = memoryview(bytearray(self.chunk_copy_size))
+                r.raw.decode_content = True
+                filesize_downloaded = 0
+                with open(temp, 'wb', buffering=4*1024*1024) as f:
+                    preallocate(f, filesize, self.fallocate)
+                    while True:
+                        n = r.raw.readinto(mv)
+                        if not n: break
+                        f.write(mv[:n])
+                        filesize_downloaded += n
+                        if self.pbar: self.pbar.update(n)
+                    if filesize_downloaded != filesize:
+                        # don't leave the reserved but never written tail behind
+                        f.truncate(filesize_downloaded)
         if self.pbar: self.pbar.close()
 
-        filesize_downloaded = Path(temp).stat().st_size
         print(f'Filesize check: expected: {filesize}; actual: {filesize_downloaded}')
         if filesize == filesize_downloaded:
             print("Succeeded.")
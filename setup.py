@@ -5,7 +5,8 @@ setup(
     version='3.2.1',
     description='A python module to download and upload from gigafile.nu',
     author='Sraqzit, fireattack',
-    install_requires=['requests>=2.25.1', 'requests_toolbelt>=0.9.1', 'tqdm>=4.61.2', 'beautifulsoup4>=4'],
+    install_requires=['requests>=2.25.1', 'tqdm>=4.61.2', 'selectolax>=0.3.17'],
+    extras_require={'io_uring': ['liburing>=2026.3.30']},
     requires=[],
     packages=['gfile'],
     platforms=["Linux", "Mac OS-X", "Windows", "Unix"],